@@ -0,0 +1,55 @@
+import os
+import argparse
+import dotenv
+from sqlalchemy import create_engine
+
+from utils.partitions import (
+    archive_partitions,
+    migrate_unpartitioned,
+    restore_partition,
+)
+
+dotenv.load_dotenv()
+
+SCHEMA = os.getenv("DB_SCHEMA")
+ARCHIVE_DIR = os.getenv("EMAIL_ARCHIVE_DIR", "email_archive")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Email table maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = subparsers.add_parser(
+        "archive", help="Detach and archive monthly partitions older than a month"
+    )
+    archive_parser.add_argument("before", help="First month to keep, e.g. 2024-01")
+
+    restore_parser = subparsers.add_parser("restore", help="Reattach an archived month")
+    restore_parser.add_argument("month", help="Month to restore, e.g. 2023-06")
+
+    subparsers.add_parser(
+        "migrate",
+        help="Copy the tables left by db/migrate_v0_partitioned.sql into partitions",
+    )
+
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    sql_engine = create_engine(os.getenv("CONN_STR"))
+    if args.command == "archive":
+        names = archive_partitions(args.before, SCHEMA, sql_engine, args.archive_dir)
+        print(f"Archived {len(names)} partitions to {args.archive_dir}: {names}")
+    elif args.command == "restore":
+        restored = restore_partition(args.month, SCHEMA, sql_engine, args.archive_dir)
+        print(f"Restored {len(restored)} partitions")
+        for name, (inserted, skipped) in restored.items():
+            print(f"  {name}: {inserted} rows restored")
+            if skipped:
+                print(
+                    f"  {name}: {skipped} rows skipped, already present "
+                    "(month was fetched again after archiving)"
+                )
+    elif args.command == "migrate":
+        copied = migrate_unpartitioned(SCHEMA, sql_engine)
+        for table, rows in copied.items():
+            print(f"Migrated {rows} rows into {table}")
@@ -17,6 +17,7 @@ class Assessment(Base):
     __tablename__ = "assessments"
 
     id = Column(Text, primary_key=True)
+    email_date = Column(DateTime(timezone=True), primary_key=True)
     time_sensitive = Column(Boolean)
     requires_response = Column(Boolean)
     payment_required = Column(Boolean)
@@ -28,12 +29,14 @@ class Acknowledge(Base):
     __tablename__ = "acknowledge"
 
     id = Column(Text, primary_key=True)
+    email_date = Column(DateTime(timezone=True), primary_key=True)
     acknowledge = Column(Boolean)
 
 
 class Email(Base):
     __tablename__ = "emails"
     id = Column(Text, primary_key=True)
+    email_date = Column(DateTime(timezone=True), primary_key=True)
     sender = Column(Text)
     recipient = Column(Text)
     subject = Column(Text)
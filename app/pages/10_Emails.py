@@ -2,10 +2,18 @@ import os
 import dotenv
 import streamlit as st
 
-from icecream import ic
 from openai import OpenAI
 
-from utils import init_app, init_emails_page
+from utils import (
+    init_app,
+    init_emails_page,
+    get_logger,
+    get_email_cache,
+    session_row_limit,
+    session_state_bytes,
+    set_session_emails,
+    to_email_date,
+)
 from my_right_hand.agent import OpenAIAgent
 
 from pages.components.email_funcs import (
@@ -22,7 +30,6 @@ from pages.components.email_funcs import (
     save_acknowledgements,
 )
 
-
 dotenv.load_dotenv()
 init_app()
 init_emails_page()
@@ -31,6 +38,20 @@ DEFAULT_WINDOW = 2
 ALL_INDICATORS = ["all"]
 ACKNOWLEDGE_FIELD = "acknowledge"
 SCHEMA = os.getenv("DB_SCHEMA")
+MAX_SESSION_STATE_BYTES = int(os.getenv("MAX_SESSION_STATE_BYTES", 1024 * 1024))
+# Each piece of session state gets its own share so one cannot starve another
+MAX_SESSION_EMAIL_ID_BYTES = int(
+    os.getenv("MAX_SESSION_EMAIL_ID_BYTES", MAX_SESSION_STATE_BYTES // 2)
+)
+MAX_SESSION_EDITOR_BYTES = int(
+    os.getenv("MAX_SESSION_EDITOR_BYTES", MAX_SESSION_STATE_BYTES // 2)
+)
+MAX_REVIEWS_PER_RUN = (
+    int(os.getenv("MAX_REVIEWS_PER_RUN")) if os.getenv("MAX_REVIEWS_PER_RUN") else None
+)
+MAX_REVIEW_SECONDS = (
+    float(os.getenv("MAX_REVIEW_SECONDS")) if os.getenv("MAX_REVIEW_SECONDS") else None
+)
 
 client = OpenAI(
     api_key=os.getenv("OAI_API_KEY"),
@@ -40,43 +61,68 @@ agent = OpenAIAgent(
     model=os.getenv("OAI_CHAT_MODEL"),
     use_snippet=False,
 )
+logger = get_logger()
+email_cache = get_email_cache()
 
 if __name__ == "__main__":
     tab_names = ["Email Details", "Retrieve New Emails"]
     tabs = st.tabs(tab_names)
+    with tabs[0]:
+        # New assessments stream in here while processing runs, the details
+        # table below is rendered with them once it finishes
+        live_results = st.empty()
     with tabs[-1]:
         fetch_email_button, start_date, end_date = render_email_fetch(DEFAULT_WINDOW)
-        review_email_ids = fetch_unreviewed_ids(
-            schema=SCHEMA,
-            sql_engine=st.session_state["sql_engine"],
-        )
         if fetch_email_button:
-            st.session_state["emails"] = fetch_emails(start_date, end_date)
-            st.session_state["new_emails"] = save_new_emails(
-                emails=st.session_state["emails"],
+            emails = fetch_emails(start_date, end_date)
+            new_emails = save_new_emails(
+                emails=emails,
                 schema=SCHEMA,
                 sql_engine=st.session_state["sql_engine"],
             )
+            emails = sorted(emails, key=lambda x: to_email_date(x.date), reverse=True)
+            email_cache.put_many(emails)
+            kept = set_session_emails(emails, new_emails, MAX_SESSION_EMAIL_ID_BYTES)
+            if kept < len(emails):
+                st.warning(
+                    f"Keeping the newest {kept} of {len(emails)} emails "
+                    "to stay within the session memory limit"
+                )
+            del emails, new_emails
             # st.rerun()
 
-        if st.session_state["emails"]:
+        if len(st.session_state["email_ids"]):
+            review_email_ids = fetch_unreviewed_ids(
+                schema=SCHEMA,
+                since=st.session_state["emails_since"],
+                sql_engine=st.session_state["sql_engine"],
+            )
             process_button = render_email_processing(
-                emails=st.session_state["emails"],
-                new_emails=st.session_state["new_emails"],
+                email_ids=st.session_state["email_ids"],
+                new_email_ids=st.session_state["new_email_ids"],
                 review_email_ids=review_email_ids,
+                load_emails=lambda ids: email_cache.get_many(
+                    ids, since=st.session_state["emails_since"]
+                ),
+            )
+        if "process_button" in locals() and process_button:
+            # Message content is only loaded when it is actually processed
+            review_id_set = set(review_email_ids)
+            emails_to_process = email_cache.get_many(
+                [x for x in st.session_state["email_ids"] if x in review_id_set],
+                since=st.session_state["emails_since"],
             )
-            emails_to_process = [
-                email
-                for email in st.session_state["emails"]
-                if email.id in review_email_ids
-            ]
-        if "emails_to_process" in locals() and process_button:
             process_emails(
                 emails=emails_to_process,
                 agent=agent,
                 schema=SCHEMA,
                 sql_engine=st.session_state["sql_engine"],
+                since=st.session_state["emails_since"],
+                max_reviews=MAX_REVIEWS_PER_RUN,
+                max_seconds=MAX_REVIEW_SECONDS,
+                results_table=live_results,
             )
+            live_results.empty()
 
     with tabs[0]:
         boolean_fields, non_boolean_fields = fetch_form_data(
@@ -92,7 +138,13 @@ if __name__ == "__main__":
             DEFAULT_WINDOW, boolean_fields, non_boolean_fields
         )
         if selected_field or date or display_fields or only_unacknowledged:
-            ic(selected_field, date, display_fields, only_unacknowledged)
+            logger.debug(
+                "email_details_options",
+                selected_field=selected_field,
+                date=date,
+                display_fields=display_fields,
+                only_unacknowledged=only_unacknowledged,
+            )
             review_filter = (
                 selected_field if selected_field not in ALL_INDICATORS else None
             )
@@ -106,21 +158,53 @@ if __name__ == "__main__":
                 schema=SCHEMA,
                 sql_engine=st.session_state["sql_engine"],
             )
-            ic(display_data)
-            form_button, st.session_state["editor_data"] = render_email_details_table(
+            logger.debug("email_details_display", display_data=display_data)
+            # Acknowledgements are saved from the rows kept in the session, so
+            # limit the table itself rather than only what is kept
+            limit = session_row_limit(
+                display_data.loc[:, ["id", "email_date", ACKNOWLEDGE_FIELD]],
+                MAX_SESSION_EDITOR_BYTES,
+            )
+            if limit < len(display_data):
+                st.warning(
+                    f"Showing the newest {limit} of {len(display_data)} emails "
+                    "to stay within the session memory limit, narrow the date "
+                    "to see the rest"
+                )
+                display_data = display_data.sort_values(
+                    "email_date", ascending=False
+                ).head(limit)
+            form_button, editor_data = render_email_details_table(
                 display_data=display_data,
                 ack_only_field_name=ACKNOWLEDGE_FIELD,
             )
+            # Only the columns needed to save acknowledgements stay in the session
+            st.session_state["editor_data"] = editor_data.loc[
+                :, ["id", "email_date", ACKNOWLEDGE_FIELD]
+            ]
+            del display_data, editor_data
         if not st.session_state["editor_data"].empty and form_button:
             bools = st.session_state["editor_data"].loc[:, ACKNOWLEDGE_FIELD]
             ids = list(st.session_state["editor_data"].loc[:, "id"].values)
+            email_dates = list(st.session_state["editor_data"].loc[:, "email_date"])
             new_results, edited_results = save_acknowledgements(
-                zip(ids, bools),
+                zip(ids, email_dates, bools),
                 schema=SCHEMA,
                 sql_engine=st.session_state["sql_engine"],
             )
-            ic(new_results)
+            logger.info(
+                "acknowledgements_saved",
+                new=len(new_results),
+                edited=len(edited_results),
+            )
             if len(new_results):
                 st.toast(f"{len(new_results)} New Acknowledgment")
             if len(edited_results):
                 st.toast(f"{len(edited_results)} Changed Acknowledgment")
+
+    if logger.enabled("DEBUG"):
+        logger.debug(
+            "session_state_size",
+            session_bytes=session_state_bytes(),
+            email_cache_bytes=email_cache.current_bytes,
+        )
@@ -8,6 +8,18 @@ import altair as alt
 from millify import millify
 
 from utils import init_budget_page
+from pages.components.budget_funcs import (
+    import_transactions,
+    load_month_rows,
+    load_period_rows,
+    load_rollups,
+    monthly_flows,
+    rollups_match,
+    save_rollups,
+    store_signature,
+    update_rollups,
+    get_filtered_rollups,
+)
 
 # from dateutil import parser
 
@@ -18,6 +30,7 @@ init_budget_page()
 
 def display_overview(
     filtered_data,
+    filtered_rollups,
     AMOUNT_FIELD,
     NEG_COLOR="#8B0000",
     POS_COLOR="#006400",
@@ -35,21 +48,21 @@ def display_overview(
     col1.metric(
         "Outflow",
         millify(
-            sum(outflow_data[AMOUNT_FIELD]),
+            sum(filtered_rollups["Outflow"]),
             precision=2,
         ),
     )
     col2.metric(
         "Inflow",
         millify(
-            sum(inflow_data[AMOUNT_FIELD]),
+            sum(filtered_rollups["Inflow"]),
             precision=2,
         ),
     )
     col3.metric(
         "Net Cash Flow",
         millify(
-            sum(filtered_data[AMOUNT_FIELD]),
+            sum(filtered_rollups["Sum"]),
             precision=2,
         ),
     )
@@ -116,33 +129,68 @@ def get_filtered_data(df, accounts, category, month, year, ALL_VAR):
     ]
 
 
-def main(df, budget_df, ALL_VAR="All", AMOUNT_FIELD="Amount"):
-    uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
-
-    if uploaded_file is not None:
-        data = pd.read_csv(uploaded_file)
-        data.to_csv(
-            os.getenv("SPEND_LOCAL_STORE"),
-            index=False,
-            mode="a",
-            header=False,
-        )
+@st.cache_data(max_entries=4)
+def fetch_period_rows(store_path, signature, year, month, ALL_VAR, chunksize):
+    # `signature` is only part of the cache key, a changed store misses
+    return load_period_rows(store_path, year, month, ALL_VAR, chunksize)
 
-        # Remove duplicates
-        df = pd.read_csv(os.getenv("SPEND_LOCAL_STORE"))
-        df.drop_duplicates(inplace=True)
-        df.to_csv(os.getenv("SPEND_LOCAL_STORE"), index=False)
 
-    # Add month, year, and week number columns based on the "Date"
-    df["Date"] = pd.to_datetime(df["Date"])
-    df["Month"] = df["Date"].dt.month
-    df["Year"] = df["Date"].dt.year
-    df["Week_Number"] = df["Date"].dt.isocalendar().week
+def main(budget_df, ALL_VAR="All", AMOUNT_FIELD="Amount"):
+    uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
 
-    unique_accounts = sorted(list(df["Account"].unique()))
-    unique_categories = sorted(list(df["Category"].unique()))
-    unique_months = sorted(list(df["Month"].unique()))
-    unique_years = sorted(list(df["Year"].unique()))
+    store_path = os.getenv("SPEND_LOCAL_STORE")
+    rollup_path = os.getenv("SPEND_ROLLUP_LOCAL_STORE")
+    chunksize = int(os.getenv("IMPORT_CHUNK_ROWS", 50000))
+    # The uploader keeps its file across reruns, only import it once
+    if uploaded_file is not None and (
+        st.session_state.get("imported_file_id") != uploaded_file.file_id
+    ):
+        rollups_current = rollups_match(rollup_path, store_signature(store_path))
+        import_stats = None
+        import_progress = st.progress(0.0, text="Importing transactions")
+        try:
+            import_stats = import_transactions(
+                uploaded_file,
+                store_path,
+                chunksize=chunksize,
+                progress_callback=lambda x: import_progress.progress(
+                    x, text="Importing transactions"
+                ),
+                AMOUNT_FIELD=AMOUNT_FIELD,
+            )
+        except ValueError as e:
+            # Chunks before the failing one may already be in the store, the
+            # changed store signature rebuilds the rollups below
+            st.error(f"Import failed: {e}")
+        import_progress.empty()
+        if import_stats is not None:
+            # A failed import is retried on the next run so the same file can
+            # be uploaded again once it is fixed
+            st.session_state["imported_file_id"] = uploaded_file.file_id
+            st.success(
+                f"Imported {import_stats['rows_added']} new of "
+                f"{import_stats['rows_read']} rows in "
+                f"{import_stats['seconds']:.1f}s "
+                f"({import_stats['rows_per_second']:,.0f} rows/s)"
+            )
+            if rollups_current and import_stats["rows_added"]:
+                # Only the months that received rows can have changed
+                signature = store_signature(store_path)
+                touched_months = import_stats["touched_months"]
+                rollup_df = update_rollups(
+                    pd.read_csv(rollup_path),
+                    load_month_rows(store_path, touched_months, chunksize),
+                    touched_months,
+                    AMOUNT_FIELD,
+                )
+                save_rollups(rollup_path, rollup_df, signature)
+
+    rollup_df = load_rollups(rollup_path, store_path, chunksize, AMOUNT_FIELD)
+
+    unique_accounts = sorted(list(rollup_df["Account"].dropna().unique()))
+    unique_categories = sorted(list(rollup_df["Category"].dropna().unique()))
+    unique_months = sorted(list(rollup_df["Month"].dropna().unique()))
+    unique_years = sorted(list(rollup_df["Year"].dropna().unique()))
 
     # Create dropdowns for "Account", "Category", "Month", "Year", and "Week Number"
     # account = st.selectbox("Select Account", [ALL_VAR] + unique_accounts)
@@ -164,13 +212,25 @@ def main(df, budget_df, ALL_VAR="All", AMOUNT_FIELD="Amount"):
     year = col3.selectbox("Select Year", [ALL_VAR] + unique_years, index=index)
 
     # Filter data based on dropdown selections
-    filtered_data = get_filtered_data(df, account, category, month, year, ALL_VAR)
+    filtered_rollups = get_filtered_rollups(
+        rollup_df, account, category, month, year, ALL_VAR
+    )
+    # Raw rows are only read for a selected year, all years chart the rollups
+    if year != ALL_VAR:
+        period_data = fetch_period_rows(
+            store_path, store_signature(store_path), year, month, ALL_VAR, chunksize
+        )
+        filtered_data = get_filtered_data(
+            period_data, account, category, month, year, ALL_VAR
+        )
+    else:
+        filtered_data = monthly_flows(filtered_rollups, AMOUNT_FIELD)
 
     tab_set = ["Overview", "Category Metrics", "Transactions", "Budget", "Statistics"]
     tabs = st.tabs(tab_set)
     # Create a bar chart to show the "Amount" data
     with tabs[0]:
-        display_overview(filtered_data, AMOUNT_FIELD)
+        display_overview(filtered_data, filtered_rollups, AMOUNT_FIELD)
 
     with tabs[1]:
         st.write(f"Showing Category Budgets for Month {month} Year {year}")
@@ -180,8 +240,8 @@ def main(df, budget_df, ALL_VAR="All", AMOUNT_FIELD="Amount"):
         category_cols = st.columns((4, 4, 4))
         for index, category in enumerate(unique_categories):
             col_index = index % 3
-            filtered_actual_data = get_filtered_data(
-                df,
+            filtered_actual_rollups = get_filtered_rollups(
+                rollup_df,
                 [ALL_VAR],
                 category,
                 month,
@@ -191,15 +251,18 @@ def main(df, budget_df, ALL_VAR="All", AMOUNT_FIELD="Amount"):
 
             display_metric(
                 category_cols[col_index],
-                filtered_actual_data,
+                filtered_actual_rollups,
                 budget_df,
                 category,
-                AMOUNT_FIELD,
+                "Sum",
                 monthly=monthly_budget,
             )
 
     with tabs[2]:
-        st.dataframe(filtered_data, hide_index=True)
+        if year != ALL_VAR:
+            st.dataframe(filtered_data, hide_index=True)
+        else:
+            st.info("Select a year to list its transactions")
     with tabs[3]:
         with st.form("Edit Budget"):
             mod_budget_df = st.data_editor(budget_df, hide_index=True)
@@ -217,12 +280,13 @@ def main(df, budget_df, ALL_VAR="All", AMOUNT_FIELD="Amount"):
         statistic = st.selectbox(
             "Select Statistic", options=["Average", "Median", "Count"]
         )
-        filtered_year_data = get_filtered_data(
-            df, account, ALL_VAR, ALL_VAR, year, ALL_VAR
+        filtered_year_rollups = get_filtered_rollups(
+            rollup_df, account, ALL_VAR, ALL_VAR, year, ALL_VAR
         )
         monthly_totals = (
-            filtered_year_data.groupby(["Category", "Month"])[AMOUNT_FIELD]
+            filtered_year_rollups.groupby(["Category", "Month"])["Sum"]
             .sum()
+            .rename(AMOUNT_FIELD)
             .reset_index()
         )
         if statistic == "Average":
@@ -263,6 +327,5 @@ def main(df, budget_df, ALL_VAR="All", AMOUNT_FIELD="Amount"):
 
 if __name__ == "__main__":
     init_budget_page()
-    spend_df = pd.read_csv(os.getenv("SPEND_LOCAL_STORE"))
     budget_df = pd.read_csv(os.getenv("BUDGET_LOCAL_STORE"))
-    main(spend_df, budget_df)
+    main(budget_df)
@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+
+ROLLUP_KEYS = ["Account", "Category", "Year", "Month"]
+REQUIRED_COLUMNS = ["Date", "Account", "Category", "Amount"]
+
+
+def add_date_parts(df: pd.DataFrame) -> pd.DataFrame:
+    # Rows imported before dates were normalized may use other formats
+    df["Date"] = pd.to_datetime(df["Date"], format="mixed")
+    df["Month"] = df["Date"].dt.month
+    df["Year"] = df["Date"].dt.year
+    df["Week_Number"] = df["Date"].dt.isocalendar().week
+    return df
+
+
+def build_rollups(df: pd.DataFrame, AMOUNT_FIELD="Amount") -> pd.DataFrame:
+    """Monthly Sum, Count, Min, Max, Inflow and Outflow per account and category"""
+    amounts = df[AMOUNT_FIELD]
+    rollups = (
+        df.assign(
+            Inflow=amounts.where(amounts > 0, 0),
+            Outflow=amounts.where(amounts <= 0, 0),
+        )
+        .groupby(ROLLUP_KEYS, dropna=False)
+        .agg(
+            Sum=(AMOUNT_FIELD, "sum"),
+            Count=(AMOUNT_FIELD, "count"),
+            Min=(AMOUNT_FIELD, "min"),
+            Max=(AMOUNT_FIELD, "max"),
+            Inflow=("Inflow", "sum"),
+            Outflow=("Outflow", "sum"),
+        )
+        .reset_index()
+    )
+    return rollups
+
+
+def update_rollups(
+    rollup_df: pd.DataFrame,
+    df: pd.DataFrame,
+    touched_months: pd.DataFrame,
+    AMOUNT_FIELD="Amount",
+) -> pd.DataFrame:
+    """Rebuilds only the Year/Month rows of `touched_months`, keeping the rest"""
+    touched = set(zip(touched_months["Year"], touched_months["Month"]))
+    keep_mask = [
+        (year, month) not in touched
+        for year, month in zip(rollup_df["Year"], rollup_df["Month"])
+    ]
+    touched_mask = [
+        (year, month) in touched for year, month in zip(df["Year"], df["Month"])
+    ]
+    return pd.concat(
+        [
+            rollup_df.loc[keep_mask, :],
+            build_rollups(df.loc[touched_mask, :], AMOUNT_FIELD),
+        ],
+        ignore_index=True,
+    ).sort_values(ROLLUP_KEYS, ignore_index=True)
+
+
+def combine_rollups(rollup_dfs: list[pd.DataFrame]) -> pd.DataFrame:
+    """Merges rollups built from separate chunks of rows"""
+    return (
+        pd.concat(rollup_dfs, ignore_index=True)
+        .groupby(ROLLUP_KEYS, dropna=False)
+        .agg(
+            Sum=("Sum", "sum"),
+            Count=("Count", "sum"),
+            Min=("Min", "min"),
+            Max=("Max", "max"),
+            Inflow=("Inflow", "sum"),
+            Outflow=("Outflow", "sum"),
+        )
+        .reset_index()
+    )
+
+
+def read_store(store_path: str, chunksize: int, keep=None):
+    """Yields the spend store's rows with date parts one chunk at a time.
+
+    `keep` takes a chunk and returns a mask of the rows to yield.
+    """
+    for chunk in pd.read_csv(store_path, chunksize=chunksize):
+        chunk = add_date_parts(chunk)
+        yield chunk if keep is None else chunk.loc[keep(chunk), :]
+
+
+def load_month_rows(
+    store_path: str, months: pd.DataFrame, chunksize: int
+) -> pd.DataFrame:
+    """Rows of the store in the Year/Month pairs of `months`"""
+    wanted = set(zip(months["Year"], months["Month"]))
+    chunks = read_store(
+        store_path,
+        chunksize,
+        keep=lambda x: [pair in wanted for pair in zip(x["Year"], x["Month"])],
+    )
+    return pd.concat(chunks, ignore_index=True)
+
+
+def load_period_rows(
+    store_path: str, year, month, ALL_VAR, chunksize: int
+) -> pd.DataFrame:
+    """Rows of the store in `year`, and in `month` unless it is ALL_VAR"""
+    chunks = read_store(
+        store_path,
+        chunksize,
+        keep=lambda x: (x["Year"] == year)
+        & ((x["Month"] == month) | (month == ALL_VAR)),
+    )
+    return pd.concat(chunks, ignore_index=True)
+
+
+def store_signature(store_path: str) -> dict:
+    """Size and mtime of the store, recorded next to rollups built from it"""
+    stat = os.stat(store_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _signature_path(path: str) -> str:
+    return f"{path}.store.json"
+
+
+def rollups_match(path: str, signature: dict) -> bool:
+    """Whether the rollups at `path` were built from a store with `signature`"""
+    if not path or not os.path.exists(path):
+        return False
+    if not os.path.exists(_signature_path(path)):
+        return False
+    with open(_signature_path(path)) as f:
+        return json.load(f) == signature
+
+
+def save_rollups(path: str, rollup_df: pd.DataFrame, signature: dict):
+    rollup_df.to_csv(path, index=False)
+    # Written last, an interrupted save leaves a signature that does not match
+    with open(_signature_path(path), "w") as f:
+        json.dump(signature, f)
+
+
+def load_rollups(
+    path: str, store_path: str, chunksize: int, AMOUNT_FIELD="Amount"
+) -> pd.DataFrame:
+    """Reads persisted rollups, rebuilding them when the store has changed.
+
+    The store's size and mtime are saved with the rollups, so a store replaced
+    or edited outside the upload path is rolled up again one chunk at a time.
+    """
+    signature = store_signature(store_path)
+    if rollups_match(path, signature):
+        return pd.read_csv(path)
+    rollup_df = combine_rollups(
+        [
+            build_rollups(chunk, AMOUNT_FIELD)
+            for chunk in read_store(store_path, chunksize)
+        ]
+    )
+    if path:
+        save_rollups(path, rollup_df, signature)
+    return rollup_df
+
+
+def get_filtered_rollups(rollup_df, accounts, category, month, year, ALL_VAR):
+    return rollup_df[
+        ((ALL_VAR in accounts) | (rollup_df["Account"].isin(accounts)))
+        & ((rollup_df["Category"] == category) | (category == ALL_VAR))
+        & ((rollup_df["Month"] == month) | (month == ALL_VAR))
+        & ((rollup_df["Year"] == year) | (year == ALL_VAR))
+    ]
+
+
+def monthly_flows(rollup_df: pd.DataFrame, AMOUNT_FIELD="Amount") -> pd.DataFrame:
+    """Inflow and Outflow per month as dated rows the overview charts can plot"""
+    totals = rollup_df.groupby(["Year", "Month"])[["Inflow", "Outflow"]].sum()
+    totals = totals.reset_index()
+    totals["Date"] = pd.to_datetime(
+        {"year": totals["Year"], "month": totals["Month"], "day": 1}
+    )
+    return pd.concat(
+        [
+            totals.loc[:, ["Date"]].assign(**{AMOUNT_FIELD: totals[x]})
+            for x in ["Inflow", "Outflow"]
+        ],
+        ignore_index=True,
+    )
+
+
+# Currency symbols, thousands separators and spaces bank exports put in amounts
+AMOUNT_NOISE = r"[\s,$€£¥]"
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def check_parsed(raw: pd.Series, parsed: pd.Series, column: str, source: str):
+    """Raises a ValueError naming the first value of `raw` that failed to parse"""
+    failed = parsed.isna()
+    if failed.any():
+        # Chunk indexes continue across chunks, +2 for the header and 1-based lines
+        line = failed.idxmax() + 2
+        first = raw[failed].fillna("").iloc[0]
+        raise ValueError(
+            f"{source} has {int(failed.sum())} {column} values that could not be "
+            f"parsed, first {first!r} at line {line}"
+        )
+
+
+def parse_amounts(values: pd.Series) -> pd.Series:
+    cleaned = values.astype("string").str.replace(AMOUNT_NOISE, "", regex=True)
+    # Accounting style negatives, "(12.50)"
+    cleaned = cleaned.str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+    return pd.to_numeric(cleaned, errors="coerce").astype("float64")
+
+
+def normalize_chunk(
+    chunk: pd.DataFrame,
+    columns: list[str],
+    AMOUNT_FIELD="Amount",
+    source="Uploaded file",
+) -> pd.DataFrame:
+    """Aligns a chunk to the store's columns in one canonical format.
+
+    Dates are written as DATE_FORMAT and amounts as float64 so the same row
+    hashes the same whichever format it arrived in.
+    """
+    chunk.columns = [str(x).strip() for x in chunk.columns]
+    missing = [x for x in columns if x not in chunk.columns]
+    if missing:
+        raise ValueError(f"{source} is missing columns: {missing}")
+    chunk = chunk.loc[:, columns]
+    for column in columns:
+        if column == AMOUNT_FIELD:
+            amounts = parse_amounts(chunk[column])
+            check_parsed(chunk[column], amounts, column, source)
+            chunk[column] = amounts
+        elif column == "Date":
+            dates = pd.to_datetime(chunk[column], format="mixed", errors="coerce")
+            check_parsed(chunk[column], dates, column, source)
+            chunk[column] = dates.dt.strftime(DATE_FORMAT).astype("string")
+        else:
+            chunk[column] = chunk[column].astype("string").str.strip()
+    return chunk
+
+
+def hash_rows(chunk: pd.DataFrame) -> np.ndarray:
+    return pd.util.hash_pandas_object(chunk, index=False).values
+
+
+def load_row_hashes(
+    store_path: str, columns: list[str], chunksize: int, AMOUNT_FIELD="Amount"
+) -> set:
+    hashes = set()
+    for chunk in pd.read_csv(store_path, chunksize=chunksize, dtype=str):
+        chunk = normalize_chunk(chunk, columns, AMOUNT_FIELD, source="Spend store")
+        hashes.update(hash_rows(chunk))
+    return hashes
+
+
+def import_transactions(
+    uploaded_file,
+    store_path: str,
+    chunksize: int = 50000,
+    progress_callback=None,
+    AMOUNT_FIELD="Amount",
+) -> dict:
+    """Streams an uploaded CSV into the spend store chunk by chunk.
+
+    Each chunk is normalized to the store's format and its rows hashed so rows
+    already in the store, or earlier in the file, are skipped. Unparseable
+    Date or Amount values raise a ValueError before their chunk is written. Only the store's row hashes and one chunk are held in memory.
+    Returns import stats including the Year/Month pairs that received rows.
+    """
+    started = time.monotonic()
+    columns = pd.read_csv(store_path, nrows=0).columns.tolist()
+    missing = [x for x in REQUIRED_COLUMNS if x not in columns]
+    if missing:
+        raise ValueError(f"Spend store is missing columns: {missing}")
+    seen = load_row_hashes(store_path, columns, chunksize, AMOUNT_FIELD)
+
+    total_bytes = max(getattr(uploaded_file, "size", 0), 1)
+    rows_read = 0
+    rows_added = 0
+    touched_months = set()
+    for chunk in pd.read_csv(uploaded_file, chunksize=chunksize, dtype=str):
+        rows_read += len(chunk)
+        chunk = normalize_chunk(chunk, columns, AMOUNT_FIELD)
+        dates = pd.to_datetime(chunk["Date"], format=DATE_FORMAT)
+
+        hashes = hash_rows(chunk)
+        mask = (
+            np.array([x not in seen for x in hashes])
+            & ~pd.Series(hashes).duplicated().values
+        )
+        seen.update(hashes[mask])
+        new_rows = chunk.loc[mask, :]
+        new_rows.to_csv(store_path, index=False, mode="a", header=False)
+        rows_added += len(new_rows)
+        touched_months.update(zip(dates[mask].dt.year, dates[mask].dt.month))
+
+        if progress_callback is not None:
+            progress_callback(min(uploaded_file.tell() / total_bytes, 1.0))
+
+    seconds = time.monotonic() - started
+    return {
+        "rows_read": rows_read,
+        "rows_added": rows_added,
+        "seconds": seconds,
+        "rows_per_second": rows_read / seconds if seconds else float(rows_read),
+        "touched_months": pd.DataFrame(
+            sorted(touched_months), columns=["Year", "Month"]
+        ),
+    }
@@ -1,44 +1,76 @@
 import os
+import re
+import time
 import dotenv
 import streamlit as st
 import pandas as pd
 
-from icecream import ic
 from datetime import datetime, timedelta
 from sqlalchemy.engine.base import Engine
 from sqlalchemy import text
 
-from utils import init_app, init_emails_page
+from utils import (
+    init_app,
+    init_emails_page,
+    get_logger,
+    get_query_cache,
+    ensure_month_partitions,
+    to_email_date,
+)
 from my_right_hand.email_client import GmailRetriever
 from my_right_hand.utils import redactor
 from my_right_hand.agent import OpenAIAgent
 from my_right_hand.models import EmailMessage, EmailReview
 
+dotenv.load_dotenv()
+logger = get_logger()
+query_cache = get_query_cache()
 
-def fetch_present_ids(schema: str, pk_list: list[str], sql_engine: Engine) -> list[str]:
+EMAIL_ADDRESS = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+
+def fetch_present_ids(
+    schema: str, pk_list: list[str], since: datetime, sql_engine: Engine
+) -> list[str]:
     with sql_engine.connect() as conn:
-        query = f"SELECT id FROM {schema}.emails WHERE id IN %(pk_list)s"
+        query = f"""
+            SELECT id FROM {schema}.emails
+            WHERE id IN %(pk_list)s AND email_date >= %(since)s
+            """
 
         matching_ids = pd.read_sql_query(
             query,
             conn,
-            params={"pk_list": tuple(pk_list)},
+            params={"pk_list": tuple(pk_list), "since": since},
         )
-    ic(matching_ids[["id"]])
+    logger.debug("fetch_present_ids", requested=len(pk_list), present=len(matching_ids))
     return matching_ids["id"].values
 
 
-def fetch_unreviewed_ids(schema: str, sql_engine: Engine) -> list[str]:
+def fetch_unreviewed_ids(schema: str, since: datetime, sql_engine: Engine) -> list[str]:
+    return query_cache.get_or_load(
+        ("unreviewed_ids", schema, since),
+        ["emails", "assessments"],
+        lambda: _fetch_unreviewed_ids(schema, since, sql_engine),
+    )
+
+
+def _fetch_unreviewed_ids(
+    schema: str, since: datetime, sql_engine: Engine
+) -> list[str]:
     with sql_engine.connect() as conn:
         query = f"""
             SELECT e.id
             FROM {schema}.emails e
-            LEFT JOIN {schema}.assessments a ON e.id = a.id
-            WHERE a.id IS NULL
+            LEFT JOIN {schema}.assessments a
+            ON e.id = a.id AND e.email_date = a.email_date
+            AND a.email_date >= %(since)s
+            WHERE a.id IS NULL AND e.email_date >= %(since)s
             """
         data = pd.read_sql_query(
             query,
             conn,
+            params={"since": since},
         )
     return data["id"].values
 
@@ -79,17 +111,21 @@ def save_new_emails(
     email_df.loc[:, "link"] = email_df.loc[:, "id"].apply(
         lambda x: f"https://mail.google.com/mail/u/0/#inbox/{x}"
     )
+    email_df.loc[:, "email_date"] = [to_email_date(x.date) for x in emails]
 
     matching_ids = fetch_present_ids(
-        schema, [x for x in email_df.loc[:, "id"].values], sql_engine=sql_engine
+        schema,
+        [x for x in email_df.loc[:, "id"].values],
+        since=email_df.loc[:, "email_date"].min(),
+        sql_engine=sql_engine,
     )
     mask = [x.id not in matching_ids for x in emails]
     email_df = email_df.loc[mask, :]
 
-    ic(email_df.head())
-    ic(mask)
+    logger.debug("save_new_emails", retrieved=len(emails), new=sum(mask))
 
     if not email_df.empty:
+        ensure_month_partitions(email_df.loc[:, "email_date"], schema, sql_engine)
         email_df.to_sql(
             "emails",
             sql_engine,
@@ -97,6 +133,7 @@ def save_new_emails(
             if_exists="append",
             index=False,
         )
+        query_cache.invalidate("emails")
         new_emails_payload = [email for email, passes in zip(emails, mask) if passes]
         return new_emails_payload
     else:
@@ -104,66 +141,298 @@ def save_new_emails(
 
 
 def render_email_processing(
-    emails: list[EmailMessage],
-    new_emails: list[EmailMessage],
+    email_ids: list[str],
+    new_email_ids: list[str],
     review_email_ids: list[str],
+    load_emails,
 ):
-    ic(review_email_ids)
+    logger.debug("render_email_processing", unreviewed=len(review_email_ids))
     with st.form("process_email"):
         col1, col2, col3 = st.columns((2, 2, 8))
-        col1.metric("Emails Retrieved", value=len(emails))
-        col2.metric("New Emails", value=len(new_emails))
+        col1.metric("Emails Retrieved", value=len(email_ids))
+        col2.metric("New Emails", value=len(new_email_ids))
         col2.metric(
             "Unreviewed Emails",
             value=len(review_email_ids),
         )
-        with col3.expander("Retrieved Emails"):
-            st.write(pd.DataFrame([x.model_dump() for x in emails]))
         process_submit = col1.form_submit_button("Process Emails")
+    # Message content is only loaded from the email cache when asked for
+    if col3.toggle("Show Retrieved Emails"):
+        col3.write(pd.DataFrame([x.model_dump() for x in load_emails(email_ids)]))
     return process_submit
 
 
+def fetch_sender_priority(
+    schema: str, sql_engine: Engine, lookback_days: int = 180
+) -> dict[str, float]:
+    """Share of each sender's recent emails that were assessed as time sensitive"""
+    since = datetime.now() - timedelta(days=lookback_days)
+    with sql_engine.connect() as conn:
+        query = f"""
+            SELECT e.sender, AVG(CAST(a.time_sensitive AS INTEGER)) AS rate
+            FROM {schema}.emails e
+            JOIN {schema}.assessments a
+            ON e.id = a.id AND e.email_date = a.email_date
+            WHERE e.email_date >= %(since)s AND a.email_date >= %(since)s
+            GROUP BY e.sender
+            """
+        data = pd.read_sql_query(query, conn, params={"since": since})
+    return dict(zip(data["sender"], data["rate"].fillna(0.0)))
+
+
+def prioritize_emails(
+    emails: list[EmailMessage],
+    sender_priority: dict[str, float],
+    recency_half_life_hours: float = 24.0,
+) -> list[EmailMessage]:
+    """Orders emails so the newest mail from time sensitive senders is reviewed first"""
+    now = pd.Timestamp.now(tz="UTC")
+
+    def score(email: EmailMessage) -> float:
+        sent = pd.to_datetime(email.date, utc=True, errors="coerce")
+        if pd.isna(sent):
+            recency = 0.0
+        else:
+            age_hours = max((now - sent).total_seconds() / 3600, 0.0)
+            recency = 0.5 ** (age_hours / recency_half_life_hours)
+        return recency + sender_priority.get(email.sender, 0.0)
+
+    return sorted(emails, key=score, reverse=True)
+
+
+def fetch_thread_candidates(
+    schema: str, since: datetime, sql_engine: Engine
+) -> pd.DataFrame:
+    """Stored emails since `since` with the fields needed to rebuild threads.
+
+    Bodies are left out, `reviewed` marks emails that already have an
+    assessment.
+    """
+    thread_id = ", e.thread_id" if "thread_id" in EmailMessage.model_fields else ""
+    with sql_engine.connect() as conn:
+        query = f"""
+            SELECT e.id, e.email_date, e.sender, e.recipient, e.subject, e.date,
+            e.snippet, a.id IS NOT NULL AS reviewed{thread_id}
+            FROM {schema}.emails e
+            LEFT JOIN {schema}.assessments a
+            ON e.id = a.id AND e.email_date = a.email_date
+            AND a.email_date >= %(since)s
+            WHERE e.email_date >= %(since)s
+            """
+        data = pd.read_sql_query(query, conn, params={"since": since})
+    return data
+
+
+def thread_key(email) -> tuple:
+    """Gmail thread id when available, otherwise normalized subject plus participants
+
+    Works for EmailMessage objects and for rows of `fetch_thread_candidates`.
+    """
+    thread_id = getattr(email, "thread_id", None)
+    if thread_id:
+        return ("thread", thread_id)
+    subject = (email.subject or "").lower()
+    subject = re.sub(r"^\s*((re|fwd?|aw|sv)\s*:\s*)+", "", subject)
+    subject = " ".join(subject.split())
+    if not subject:
+        return ("email", email.id)
+    participants = EMAIL_ADDRESS.findall(
+        f"{email.sender or ''} {email.recipient or ''}".lower()
+    )
+    return ("subject", subject, frozenset(participants))
+
+
+def group_threads(emails: list) -> dict[tuple, list]:
+    """Groups emails or stored rows by thread key"""
+    threads = {}
+    for email in emails:
+        threads.setdefault(thread_key(email), []).append(email)
+    return threads
+
+
+def condense_thread(
+    newest: EmailMessage, earlier: list, max_context_chars: int = 2000
+) -> EmailMessage:
+    """`newest` with the earlier messages of its thread summarized into its body"""
+    if not earlier:
+        return newest
+    context = []
+    for email in reversed(earlier):
+        context.append(f"From {email.sender} on {email.date}: {email.snippet}")
+        if sum(len(x) for x in context) >= max_context_chars:
+            break
+    condensed_context = "\n".join(context)[:max_context_chars]
+    return newest.model_copy(
+        update={
+            "body": f"{newest.body}\n\n--- Earlier in this thread ---\n"
+            f"{condensed_context}"
+        }
+    )
+
+
+def save_assessment(
+    emails: list[EmailMessage],
+    email_dates: dict,
+    review: EmailReview,
+    schema: str,
+    sql_engine: Engine,
+) -> pd.DataFrame:
+    """Saves one review for every email in `emails`, e.g. all messages of a thread"""
+    review_df = pd.DataFrame([review.model_dump()] * len(emails))
+    review_df["id"] = [x.id for x in emails]
+    review_df["email_date"] = [email_dates[x.id] for x in emails]
+    review_df.to_sql(
+        "assessments",
+        sql_engine,
+        schema=schema,
+        if_exists="append",
+        index=False,
+    )
+    query_cache.invalidate("assessments")
+    return review_df
+
+
+def update_assessments(
+    keys: list[tuple[str, datetime]],
+    review: EmailReview,
+    schema: str,
+    sql_engine: Engine,
+) -> pd.DataFrame:
+    """Overwrites the flags of already assessed (id, email_date) rows with `review`"""
+    flags = review.model_dump()
+    review_df = pd.DataFrame([flags] * len(keys))
+    review_df["id"] = [x[0] for x in keys]
+    review_df["email_date"] = [x[1] for x in keys]
+    if not keys:
+        return review_df
+    assignments = ", ".join(f"{x} = :{x}" for x in flags)
+    with sql_engine.connect() as conn:
+        conn.execute(
+            text(
+                f"UPDATE {schema}.assessments SET {assignments}, edited_date = now() "
+                f"WHERE id = :id AND email_date = :email_date"
+            ),
+            review_df.to_dict(orient="records"),
+        )
+        conn.commit()
+    query_cache.invalidate("assessments")
+    return review_df
+
+
 def process_emails(
     emails: list[EmailMessage],
     agent: OpenAIAgent,
     schema: str,
     sql_engine: Engine,
+    since: datetime,
+    max_reviews: int | None = None,
+    max_seconds: float | None = None,
+    thread_lookback_days: int = 30,
+    results_table=None,
 ):
+    """Reviews email threads in priority order, saving each assessment as it completes.
+
+    Threads are rebuilt from the emails stored since `since` minus
+    `thread_lookback_days`, so a new reply joins the messages assessed on
+    earlier runs. Only the newest unreviewed message of each thread is sent to
+    the agent, with the earlier messages condensed into it. Its flags are
+    inserted for the thread's unreviewed messages and replace the flags of
+    its earlier, already assessed ones. Stops early once `max_reviews` LLM
+    calls or `max_seconds` have been spent, the remaining emails stay
+    unreviewed for the next run. Completed rows are streamed to
+    `results_table`, a placeholder from the caller.
+    """
     progress_bar = st.progress(0)
+    if results_table is None:
+        results_table = st.empty()
 
-    ic(emails)
-    MAX_PROGRESS = len(emails)
-
-    ids = []
-    reviews = []
-    for index, email_data in enumerate(emails):
+    total = len(emails)
+    stored = fetch_thread_candidates(
+        schema, since - timedelta(days=thread_lookback_days), sql_engine
+    )
+    # Assessments must carry the email_date stored at fetch time or they
+    # will not join back to their email
+    email_dates = dict(zip(stored["id"], stored["email_date"]))
+    stored_rows = {x.id: x for x in stored.itertuples(index=False)}
+    stored_threads = group_threads(stored_rows.values())
+
+    emails = [x for x in emails if x.id in email_dates]
+    pending = group_threads(emails)
+    newest = {
+        max(members, key=lambda x: email_dates[x.id]).id: key
+        for key, members in pending.items()
+    }
+    to_review = prioritize_emails(
+        [x for x in emails if x.id in newest],
+        fetch_sender_priority(schema, sql_engine),
+    )
+    if max_reviews is not None:
+        to_review = to_review[:max_reviews]
+    logger.info("process_emails_start", count=total, threads=len(pending))
+    MAX_PROGRESS = len(to_review)
+
+    started = time.monotonic()
+    reviewed_rows = []
+    inserted_count = 0
+    updated_count = 0
+    for index, email_data in enumerate(to_review):
+        if max_seconds is not None and time.monotonic() - started > max_seconds:
+            logger.info("process_emails_budget_reached", threads=index)
+            break
         progress_bar.progress((index + 1) / MAX_PROGRESS)
-        email_redacted = email_data.redact_data(redactor)
-        ic(email_redacted)
+        key = newest[email_data.id]
+        newest_date = email_dates[email_data.id]
+        earlier = sorted(
+            [
+                x
+                for x in stored_threads.get(key, [])
+                if x.id != email_data.id and x.email_date <= newest_date
+            ],
+            key=lambda x: x.email_date,
+        )
+        if logger.enabled("DEBUG"):
+            email_redacted = email_data.redact_data(redactor)
+            logger.debug(
+                "process_email",
+                id=email_data.id,
+                thread_size=len(earlier) + 1,
+                subject=email_redacted.subject,
+                body=email_redacted.body,
+            )
         try:
-            reviewed = agent.review(email_data)
-            reviews.append(reviewed)
-            ids.append(email_data.id)
-        except Exception:
-            pass
-    if len(reviews) > 0:
-        reviews_df = pd.DataFrame([x.model_dump() for x in reviews])
-        ic(reviews_df)
-        ic(ids)
-        reviews_df["id"] = ids
-        # reviews_df.loc[:, "id"] = ids
-
-        ic(reviews_df.head())
-        reviews_df.to_sql(
-            "assessments",
-            sql_engine,
-            schema=schema,
-            if_exists="append",
-            index=False,
+            reviewed = agent.review(condense_thread(email_data, earlier))
+            inserted_df = save_assessment(
+                pending[key], email_dates, reviewed, schema, sql_engine
+            )
+            updated_df = update_assessments(
+                [(x.id, x.email_date) for x in earlier if x.reviewed],
+                reviewed,
+                schema,
+                sql_engine,
+            )
+        except Exception as e:
+            logger.error("review_failed", id=email_data.id, error=e)
+            continue
+        inserted_count += len(inserted_df)
+        updated_count += len(updated_df)
+        review_df = pd.concat([inserted_df, updated_df], ignore_index=True)
+        review_df.insert(
+            1, "subject", [stored_rows[x].subject for x in review_df["id"]]
+        )
+        review_df.insert(1, "sender", [stored_rows[x].sender for x in review_df["id"]])
+        reviewed_rows.append(review_df.drop(columns=["email_date"]))
+        results_table.dataframe(
+            pd.concat(reviewed_rows, ignore_index=True), hide_index=True
         )
 
     progress_bar.empty()
-    st.success(f"Processing Complete! {len(reviews)} Emails Reviewed.")
+    remaining = total - inserted_count
+    st.success(
+        f"Processing Complete! {inserted_count} Emails Reviewed "
+        f"With {len(reviewed_rows)} Agent Calls."
+        + (f" {updated_count} Earlier Thread Emails Updated." if updated_count else "")
+        + (f" {remaining} Left For The Next Run." if remaining else "")
+    )
 
 
 def fetch_form_data(
@@ -171,9 +440,22 @@ def fetch_form_data(
     sql_engine: Engine,
     exclusions: list[str] = [
         "id",
+        "email_date",
         "created_date",
         "edited_date",
     ],
+) -> tuple[list[str]]:
+    # Column lists only change with the schema, not with data, so they are
+    # cached until the cache listener reconnects
+    return query_cache.get_or_load(
+        ("form_data", schema, tuple(exclusions)),
+        [],
+        lambda: _fetch_form_data(schema, sql_engine, exclusions),
+    )
+
+
+def _fetch_form_data(
+    schema: str, sql_engine: Engine, exclusions: list[str]
 ) -> tuple[list[str]]:
     with sql_engine.connect() as conn:
         query_columns = f"SELECT * FROM {schema}.assessments LIMIT 0"
@@ -226,17 +508,20 @@ def fetch_display_data(
     sql_engine: Engine,
 ):
     if display_fields:
-        fields = f"""e.id, {ack_only_field_name}, {','.join(display_fields)}, {','.join(boolean_fields)}"""
+        fields = f"""e.id, e.email_date, {ack_only_field_name}, {','.join(display_fields)}, {','.join(boolean_fields)}"""
     else:
-        fields = f"""e.id, {ack_only_field_name}, {','.join(boolean_fields)}"""
+        fields = (
+            f"""e.id, e.email_date, {ack_only_field_name}, {','.join(boolean_fields)}"""
+        )
     with sql_engine.connect() as conn:
         query = f"""
             SELECT {fields} FROM {schema}.emails e
             JOIN {schema}.assessments a
-            ON e.id = a.id
+            ON e.id = a.id AND e.email_date = a.email_date
             LEFT JOIN {schema}.acknowledge ack
-            ON e.id = ack.id
-            WHERE CAST(e.date AS DATE) >= %(date)s
+            ON e.id = ack.id AND e.email_date = ack.email_date
+            AND ack.email_date >= %(date)s
+            WHERE e.email_date >= %(date)s AND a.email_date >= %(date)s
         """
         if only_unacknowledged:
             query += f" AND {ack_only_field_name} <> True"
@@ -267,48 +552,63 @@ def render_email_details_table(display_data: pd.DataFrame, ack_only_field_name:
             disabled=[
                 x for x in display_data.columns.values if x != ack_only_field_name
             ],
+            # Partition key, kept so acknowledgements can target one partition
+            column_config={"email_date": None},
             hide_index=True,
         )
     return form_button, editor_data
 
 
 def save_acknowledgements(
-    email_ids: tuple[str, bool],
+    email_ids: tuple[str, datetime, bool],
     schema: str,
     sql_engine: Engine,
 ):
+    """Saves (id, email_date, acknowledge) rows from the details table.
+
+    Every statement filters on email_date as well as id so it only touches
+    the email's own partition.
+    """
     new_acknowledgements = []
     unacknowledgements = []
-    for email_id, ack_bool in email_ids:
+    for email_id, email_date, ack_bool in email_ids:
+        params = {"id": email_id, "email_date": email_date, "ack": bool(ack_bool)}
         with sql_engine.connect() as conn:
             result = conn.execute(
-                text(f"SELECT * FROM {schema}.acknowledge WHERE id = '{email_id}'")
+                text(
+                    f"SELECT id, acknowledge FROM {schema}.acknowledge "
+                    f"WHERE id = :id AND email_date = :email_date"
+                ),
+                params,
             )
             existing_record = result.fetchone()
             if existing_record is None:
                 query = text(
                     (
                         f"INSERT INTO {schema}.acknowledge "
-                        f"(id, acknowledge) VALUES ('{email_id}', {ack_bool})"
+                        f"(id, email_date, acknowledge) "
+                        f"VALUES (:id, :email_date, :ack)"
                     )
                 )
-                conn.execute(query)
+                conn.execute(query, params)
                 conn.commit()
                 new_acknowledgements.append(email_id)
             elif existing_record[1] != ack_bool:  # Change
                 query = text(
                     (
-                        f"UPDATE {schema}.acknowledge "
-                        f"SET acknowledge = {ack_bool} WHERE id = '{email_id}'"
+                        f"UPDATE {schema}.acknowledge SET acknowledge = :ack "
+                        f"WHERE id = :id AND email_date = :email_date"
                     )
                 )
-                conn.execute(query)
+                conn.execute(query, params)
                 conn.commit()
                 if ack_bool:
                     new_acknowledgements.append(email_id)
                 else:
                     unacknowledgements.append(email_id)
 
+    if new_acknowledgements or unacknowledgements:
+        query_cache.invalidate("acknowledge")
     return new_acknowledgements, unacknowledgements
     # pass
     # export = displayed_data.loc[:, [id_field, ack_field]]
@@ -1,7 +1,38 @@
-from .initalization import init_budget_page, init_emails_page, init_app
+from .initalization import (
+    init_budget_page,
+    init_emails_page,
+    init_app,
+    set_session_emails,
+    session_row_limit,
+    session_state_bytes,
+)
+from .email_cache import EmailCache, get_email_cache
+from .structured_logger import StructuredLogger, get_logger
+from .query_cache import QueryCache, get_query_cache
+from .partitions import (
+    archive_partitions,
+    ensure_month_partitions,
+    migrate_unpartitioned,
+    restore_partition,
+    to_email_date,
+)
 
 __all__ = [
     "init_app",
     "init_budget_page",
     "init_emails_page",
+    "set_session_emails",
+    "session_row_limit",
+    "session_state_bytes",
+    "EmailCache",
+    "get_email_cache",
+    "StructuredLogger",
+    "get_logger",
+    "QueryCache",
+    "get_query_cache",
+    "archive_partitions",
+    "ensure_month_partitions",
+    "migrate_unpartitioned",
+    "restore_partition",
+    "to_email_date",
 ]
@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.engine.base import Engine
+
+from my_right_hand.models import EmailMessage
+
+
+def email_size(email: EmailMessage) -> int:
+    return sum(len(str(x)) for x in email.model_dump().values())
+
+
+class EmailCache:
+    """Size bounded LRU of EmailMessage objects shared by every session.
+
+    Sessions keep only email ids and look the messages up here, misses are
+    loaded from the `emails` table in one query.
+    """
+
+    def __init__(self, sql_engine: Engine, schema: str, max_bytes: int):
+        self.sql_engine = sql_engine
+        self.schema = schema
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put_many(self, emails: list[EmailMessage]):
+        with self._lock:
+            for email in emails:
+                self._put(email)
+
+    def get_many(self, ids: list[str], since=None) -> list[EmailMessage]:
+        """Returns the emails for `ids` in order, skipping ids not in the database.
+
+        `since` bounds email_date when loading misses so only the matching
+        partitions are scanned.
+        """
+        found = {}
+        with self._lock:
+            for email_id in ids:
+                if email_id in self._entries:
+                    self._entries.move_to_end(email_id)
+                    found[email_id] = self._entries[email_id][0]
+        missing = [x for x in ids if x not in found]
+        if missing:
+            loaded = self._load(missing, since)
+            self.put_many(loaded)
+            found.update({x.id: x for x in loaded})
+        return [found[x] for x in ids if x in found]
+
+    def _put(self, email: EmailMessage):
+        if email.id in self._entries:
+            self.current_bytes -= self._entries.pop(email.id)[1]
+        size = email_size(email)
+        self._entries[email.id] = (email, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+
+    def _load(self, ids: list[str], since=None) -> list[EmailMessage]:
+        query = f"SELECT * FROM {self.schema}.emails WHERE id IN %(ids)s"
+        params = {"ids": tuple(ids)}
+        if since is not None:
+            query += " AND email_date >= %(since)s"
+            params["since"] = since
+        with self.sql_engine.connect() as conn:
+            data = pd.read_sql_query(query, conn, params=params)
+        fields = [x for x in EmailMessage.model_fields if x in data.columns]
+        return [
+            EmailMessage(**x) for x in data.loc[:, fields].to_dict(orient="records")
+        ]
+
+
+_email_cache = None
+_email_cache_lock = threading.Lock()
+
+
+def get_email_cache() -> EmailCache:
+    """Process-wide email cache shared by every Streamlit session"""
+    global _email_cache
+    with _email_cache_lock:
+        if _email_cache is None:
+            _email_cache = EmailCache(
+                sql_engine=create_engine(os.getenv("CONN_STR")),
+                schema=os.getenv("DB_SCHEMA"),
+                max_bytes=int(os.getenv("EMAIL_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+            )
+    return _email_cache
@@ -1,8 +1,12 @@
 import os
+import sys
+import numpy as np
 import pandas as pd
 import streamlit as st
 from sqlalchemy import create_engine
 
+from .partitions import to_email_date
+
 
 def init_app():
     if "initialized_app" not in st.session_state:
@@ -11,10 +15,12 @@ def init_app():
 
 
 def init_emails_page():
-    if "emails" not in st.session_state:
-        st.session_state["emails"] = []
-        st.session_state["new_emails"] = []
-        st.session_state["emails_needing_review"] = []
+    # Sessions only hold email ids, message content lives in the shared
+    # EmailCache, see utils.email_cache
+    if "email_ids" not in st.session_state:
+        st.session_state["email_ids"] = np.array([], dtype=str)
+        st.session_state["new_email_ids"] = np.array([], dtype=str)
+        st.session_state["emails_since"] = None
         st.session_state["editor_data"] = pd.DataFrame()
     if "sql_engine" not in st.session_state:
         st.session_state["sql_engine"] = create_engine(
@@ -23,5 +29,54 @@ def init_emails_page():
         )
 
 
+def set_session_emails(emails: list, new_emails: list, max_bytes: int = None) -> int:
+    """Stores the ids of `emails`, newest first, in the session.
+
+    Drops the oldest ids until the id arrays fit in `max_bytes` and returns
+    how many emails were kept. Other session state has its own budget.
+    """
+    ids = np.array([x.id for x in emails], dtype=str)
+    new_ids = np.array([x.id for x in new_emails], dtype=str)
+    kept = len(ids)
+    if max_bytes is not None and ids.nbytes + new_ids.nbytes > max_bytes:
+        is_new = np.isin(ids, new_ids)
+        # Bytes held when keeping the newest 1..n ids, never more after trimming
+        sizes = np.arange(1, kept + 1) * ids.itemsize + (
+            np.cumsum(is_new) * new_ids.itemsize
+        )
+        kept = int(np.searchsorted(sizes, max_bytes, side="right"))
+        # Copy so the trimmed array does not keep the full buffer alive
+        ids = ids[:kept].copy()
+        kept_ids = set(ids)
+        new_ids = np.array([x.id for x in new_emails if x.id in kept_ids], dtype=str)
+    st.session_state["email_ids"] = ids
+    st.session_state["new_email_ids"] = new_ids
+    st.session_state["emails_since"] = (
+        min(to_email_date(x.date) for x in emails[:kept]) if kept else None
+    )
+    return kept
+
+
+def session_row_limit(data: pd.DataFrame, max_bytes: int) -> int:
+    """How many rows of `data` fit in `max_bytes` of session state"""
+    if data.empty:
+        return 0
+    row_bytes = data.memory_usage(deep=True).sum() / len(data)
+    return min(int(max_bytes // row_bytes), len(data))
+
+
+def session_state_bytes() -> int:
+    """Approximate memory held by the current session's state"""
+    total = 0
+    for value in st.session_state.values():
+        if isinstance(value, np.ndarray):
+            total += value.nbytes
+        elif isinstance(value, pd.DataFrame):
+            total += int(value.memory_usage(deep=True).sum())
+        else:
+            total += sys.getsizeof(value)
+    return total
+
+
 def init_budget_page():
     pass
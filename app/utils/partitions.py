@@ -0,0 +1,238 @@
+import os
+import gzip
+import shutil
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine.base import Engine
+
+from .query_cache import NOTIFY_CHANNEL
+
+PARTITIONED_TABLES = ["emails", "assessments", "acknowledge"]
+UNKNOWN_EMAIL_DATE = pd.Timestamp("1970-01-01", tz="UTC")
+
+
+def month_start(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    return ts.normalize().replace(day=1)
+
+
+def to_email_date(value) -> pd.Timestamp:
+    """Partition key of an email.
+
+    Unparseable dates map to the fixed UNKNOWN_EMAIL_DATE so the key is the
+    same every time an email is fetched. Once stored, read the key back from
+    `emails` instead of deriving it again.
+    """
+    parsed = pd.to_datetime(value, utc=True, errors="coerce")
+    return UNKNOWN_EMAIL_DATE if pd.isna(parsed) else parsed
+
+
+def partition_name(table: str, month: pd.Timestamp) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def create_month_partition(
+    table: str, month: pd.Timestamp, schema: str, sql_engine: Engine
+):
+    start = month_start(month)
+    end = start + pd.DateOffset(months=1)
+    with sql_engine.connect() as conn:
+        conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {schema}.{partition_name(table, start)} "
+                f"PARTITION OF {schema}.{table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        )
+        conn.commit()
+
+
+def ensure_month_partitions(dates: pd.Series, schema: str, sql_engine: Engine):
+    """Creates the monthly partitions of every email table covering `dates`"""
+    months = {month_start(x) for x in dates.dropna()}
+    for month in sorted(months):
+        for table in PARTITIONED_TABLES:
+            create_month_partition(table, month, schema, sql_engine)
+
+
+def list_month_partitions(table: str, schema: str, sql_engine: Engine) -> list[str]:
+    with sql_engine.connect() as conn:
+        query = text("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            JOIN pg_namespace n ON n.oid = p.relnamespace
+            WHERE n.nspname = :schema AND p.relname = :table
+            """)
+        result = conn.execute(query, {"schema": schema, "table": table})
+        names = [row[0] for row in result]
+    return sorted(x for x in names if x != f"{table}_default")
+
+
+def _archive_path(archive_dir: str, name: str) -> str:
+    return os.path.join(archive_dir, f"{name}.csv.gz")
+
+
+def archive_partitions(
+    before, schema: str, sql_engine: Engine, archive_dir: str
+) -> list[str]:
+    """Detaches every monthly partition older than `before` and archives it.
+
+    Each partition is detached, written to `archive_dir` as a gzipped CSV and
+    dropped in one transaction, so a failed export leaves it attached.
+    Returns the archived partition names.
+    """
+    cutoff = month_start(before)
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    for table in PARTITIONED_TABLES:
+        for name in list_month_partitions(table, schema, sql_engine):
+            month = pd.Timestamp(
+                year=int(name[-7:-3]), month=int(name[-2:]), day=1, tz="UTC"
+            )
+            if month >= cutoff:
+                continue
+            path = _archive_path(archive_dir, name)
+            raw_conn = sql_engine.raw_connection()
+            try:
+                with raw_conn.cursor() as cursor, gzip.open(path, "wt") as f:
+                    cursor.execute(
+                        f"ALTER TABLE {schema}.{table} DETACH PARTITION {schema}.{name}"
+                    )
+                    cursor.copy_expert(
+                        f"COPY {schema}.{name} TO STDOUT WITH CSV HEADER", f
+                    )
+                    cursor.execute(f"DROP TABLE {schema}.{name}")
+                    # Writes straight to partitions skip the parent's triggers
+                    cursor.execute(f"NOTIFY {NOTIFY_CHANNEL}, '{table}'")
+                raw_conn.commit()
+            except Exception:
+                raw_conn.rollback()
+                if os.path.exists(path):
+                    os.remove(path)
+                raise
+            finally:
+                raw_conn.close()
+            archived.append(name)
+    return archived
+
+
+def restore_partition(
+    month, schema: str, sql_engine: Engine, archive_dir: str
+) -> dict[str, tuple[int, int]]:
+    """Reattaches the archived partitions of `month` for every email table.
+
+    Rows are staged and merged with ON CONFLICT DO NOTHING, so a month that
+    was fetched again after archiving keeps its current rows. Returns the
+    restored and skipped row counts per partition.
+    """
+    start = month_start(month)
+    restored = {}
+    for table in PARTITIONED_TABLES:
+        name = partition_name(table, start)
+        path = _archive_path(archive_dir, name)
+        if not os.path.exists(path):
+            continue
+        create_month_partition(table, start, schema, sql_engine)
+        raw_conn = sql_engine.raw_connection()
+        try:
+            with raw_conn.cursor() as cursor, gzip.open(path, "rt") as f:
+                cursor.execute(
+                    f"CREATE TEMP TABLE restore_staging "
+                    f"(LIKE {schema}.{name}) ON COMMIT DROP"
+                )
+                cursor.copy_expert("COPY restore_staging FROM STDIN WITH CSV HEADER", f)
+                cursor.execute("SELECT COUNT(*) FROM restore_staging")
+                staged = cursor.fetchone()[0]
+                cursor.execute(
+                    f"INSERT INTO {schema}.{name} "
+                    f"SELECT * FROM restore_staging ON CONFLICT DO NOTHING"
+                )
+                inserted = cursor.rowcount
+                cursor.execute(f"NOTIFY {NOTIFY_CHANNEL}, '{table}'")
+            raw_conn.commit()
+        except Exception:
+            raw_conn.rollback()
+            raise
+        finally:
+            raw_conn.close()
+        shutil.move(path, f"{path}.restored")
+        restored[name] = (inserted, staged - inserted)
+    return restored
+
+
+def migrate_unpartitioned(
+    schema: str, sql_engine: Engine, chunksize: int = 10000
+) -> dict[str, int]:
+    """Copies the *_unpartitioned tables left by db/migrate_v0_partitioned.sql.
+
+    email_date is computed with to_email_date so migrated emails get the same
+    partition key the app derives when it fetches them again. The keys are
+    staged in a table, then every row is copied and the old tables dropped in
+    one transaction. Returns the copied row counts per table.
+    """
+    with sql_engine.connect() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {schema}.email_date_keys"))
+        conn.execute(
+            text(
+                f"CREATE TABLE {schema}.email_date_keys "
+                "(id TEXT PRIMARY KEY, email_date TIMESTAMP WITH TIME ZONE NOT NULL)"
+            )
+        )
+        conn.commit()
+    with sql_engine.connect() as read_conn, sql_engine.connect() as write_conn:
+        query = text(f"SELECT id, date FROM {schema}.emails_unpartitioned")
+        for chunk in pd.read_sql_query(query, read_conn, chunksize=chunksize):
+            chunk["email_date"] = chunk["date"].map(to_email_date)
+            ensure_month_partitions(chunk["email_date"], schema, sql_engine)
+            chunk.loc[:, ["id", "email_date"]].to_sql(
+                "email_date_keys",
+                write_conn,
+                schema=schema,
+                if_exists="append",
+                index=False,
+            )
+        write_conn.commit()
+
+    copied = {}
+    with sql_engine.begin() as conn:
+        copied["emails"] = conn.execute(text(f"""
+                INSERT INTO {schema}.emails (
+                    id, email_date, sender, recipient, subject, body, date,
+                    snippet, link, created_date, edited_date
+                )
+                SELECT
+                    u.id, k.email_date, u.sender, u.recipient, u.subject, u.body,
+                    u.date, u.snippet, u.link, u.created_date, u.edited_date
+                FROM {schema}.emails_unpartitioned u
+                JOIN {schema}.email_date_keys k ON k.id = u.id
+                """)).rowcount
+        copied["assessments"] = conn.execute(text(f"""
+                INSERT INTO {schema}.assessments (
+                    id, email_date, time_sensitive, requires_response,
+                    payment_required, payment_received, attention_req,
+                    created_date, edited_date
+                )
+                SELECT
+                    a.id, k.email_date, a.time_sensitive, a.requires_response,
+                    a.payment_required, a.payment_received, a.attention_req,
+                    a.created_date, a.edited_date
+                FROM {schema}.assessments_unpartitioned a
+                JOIN {schema}.email_date_keys k ON k.id = a.id
+                """)).rowcount
+        copied["acknowledge"] = conn.execute(text(f"""
+                INSERT INTO {schema}.acknowledge (
+                    id, email_date, acknowledge, created_date, edited_date
+                )
+                SELECT
+                    ack.id, k.email_date, ack.acknowledge, ack.created_date,
+                    ack.edited_date
+                FROM {schema}.acknowledge_unpartitioned ack
+                JOIN {schema}.email_date_keys k ON k.id = ack.id
+                """)).rowcount
+        for table in PARTITIONED_TABLES:
+            conn.execute(text(f"DROP TABLE {schema}.{table}_unpartitioned"))
+        conn.execute(text(f"DROP TABLE {schema}.email_date_keys"))
+    return copied
@@ -0,0 +1,103 @@
+import os
+import select
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine.base import Engine
+
+NOTIFY_CHANNEL = "email_changes"
+
+
+class QueryCache:
+    """Process-wide query result cache invalidated by Postgres NOTIFY events.
+
+    Each entry is tagged with the tables it reads. A daemon thread LISTENs on
+    `NOTIFY_CHANNEL`, whose payload is the changed table name, and drops the
+    entries tagged with it. While the listener is not connected nothing is
+    cached, so results are never served stale.
+    """
+
+    def __init__(self, sql_engine: Engine, channel: str = NOTIFY_CHANNEL):
+        self.sql_engine = sql_engine
+        self.channel = channel
+        self._entries = {}
+        self._tags = {}
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._listening = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def get_or_load(self, key: tuple, tables: list[str], loader):
+        if not self._listening.is_set():
+            return loader()
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+            generations = self._snapshot(tables)
+        value = loader()
+        with self._lock:
+            # Drop the result if one of its tables changed while it was loading
+            if self._listening.is_set() and generations == self._snapshot(tables):
+                self._entries[key] = value
+                for table in tables:
+                    self._tags.setdefault(table, set()).add(key)
+        return value
+
+    def invalidate(self, table: str):
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            for key in self._tags.pop(table, set()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def _snapshot(self, tables: list[str]) -> tuple:
+        return (self._epoch,) + tuple(self._generations.get(x, 0) for x in tables)
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                print(f"Query cache listener disconnected: {e}")
+            self._listening.clear()
+            self.clear()
+            time.sleep(5)
+
+    def _listen(self):
+        raw_conn = self.sql_engine.raw_connection()
+        try:
+            dbapi_conn = raw_conn.driver_connection
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+            self._listening.set()
+            while True:
+                if select.select([dbapi_conn], [], [], 60) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    notify = dbapi_conn.notifies.pop(0)
+                    self.invalidate(notify.payload)
+        finally:
+            raw_conn.invalidate()
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryCache:
+    """Process-wide cache shared by every Streamlit session"""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryCache(sql_engine=create_engine(os.getenv("CONN_STR")))
+    return _query_cache
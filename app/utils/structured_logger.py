@@ -0,0 +1,138 @@
+import os
+import json
+import queue
+import random
+import threading
+import uuid
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine.base import Engine
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+
+class StructuredLogger:
+    """Leveled key/value logger that batch-writes records to the `logs` table.
+
+    Records are built only when their level is enabled, so disabled debug
+    calls cost a dict lookup. Writes happen on a daemon thread that drains
+    an in-memory queue in batches.
+    """
+
+    def __init__(
+        self,
+        sql_engine: Engine,
+        schema: str,
+        level: str = "INFO",
+        sample_rate: float = 1.0,
+        max_field_chars: int = 500,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+        max_queue: int = 10000,
+    ):
+        self.sql_engine = sql_engine
+        self.schema = schema
+        self.level = LEVELS.get(level.upper(), LEVELS["INFO"])
+        self.sample_rate = sample_rate
+        self.max_field_chars = max_field_chars
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS[level] >= self.level
+
+    def debug(self, event: str, **fields):
+        self._log("DEBUG", event, fields)
+
+    def info(self, event: str, **fields):
+        self._log("INFO", event, fields)
+
+    def warning(self, event: str, **fields):
+        self._log("WARNING", event, fields)
+
+    def error(self, event: str, **fields):
+        self._log("ERROR", event, fields)
+
+    def _log(self, level: str, event: str, fields: dict):
+        if not self.enabled(level):
+            return
+        # Sampling only thins out chatty levels, warnings and errors always land
+        if LEVELS[level] < LEVELS["WARNING"] and random.random() >= self.sample_rate:
+            return
+        record = {
+            "ts": datetime.now().isoformat(),
+            "level": level,
+            "event": event,
+            "fields": {k: self._cap(v) for k, v in fields.items()},
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def _cap(self, value):
+        if isinstance(value, (bool, int, float)) or value is None:
+            return value
+        if isinstance(value, pd.DataFrame):
+            return {"rows": len(value), "columns": list(value.columns)}
+        if not isinstance(value, str) and hasattr(value, "__len__"):
+            return {"type": type(value).__name__, "len": len(value)}
+        if not isinstance(value, str) and hasattr(value, "id"):
+            # Models such as EmailMessage are logged by id, never by body
+            return {"type": type(value).__name__, "id": str(value.id)}
+        value = str(value)
+        if len(value) > self.max_field_chars:
+            return value[: self.max_field_chars] + "...[truncated]"
+        return value
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            self._write(batch)
+
+    def _write(self, batch: list[dict]):
+        rows = [
+            {"id": uuid.uuid4().hex, "description": json.dumps(record, default=str)}
+            for record in batch
+        ]
+        try:
+            with self.sql_engine.connect() as conn:
+                conn.execute(
+                    text(
+                        f"INSERT INTO {self.schema}.logs (id, description) "
+                        "VALUES (:id, :description)"
+                    ),
+                    rows,
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"Failed to write {len(rows)} log records: {e}")
+
+
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def get_logger() -> StructuredLogger:
+    """Process-wide logger shared by every Streamlit session"""
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            _logger = StructuredLogger(
+                sql_engine=create_engine(os.getenv("CONN_STR")),
+                schema=os.getenv("DB_SCHEMA"),
+                level=os.getenv("LOG_LEVEL", "INFO"),
+                sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "1.0")),
+                max_field_chars=int(os.getenv("LOG_MAX_FIELD_CHARS", "500")),
+            )
+    return _logger
@@ -2,8 +2,12 @@ CREATE SCHEMA IF NOT EXISTS v0;
 
 SET search_path TO v0;
 
+-- Email tables are range partitioned by month on email_date so date bounded
+-- queries only touch the months they need. Monthly partitions are created by
+-- the app on insert, the default partitions catch anything outside of them.
 CREATE TABLE assessments (
 	id TEXT NOT NULL, 
+	email_date TIMESTAMP WITH TIME ZONE NOT NULL, 
 	time_sensitive BOOLEAN, 
 	requires_response BOOLEAN, 
 	payment_required BOOLEAN, 
@@ -11,21 +15,27 @@ CREATE TABLE assessments (
 	attention_req BOOLEAN, 
 	created_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(), 
 	edited_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(), 
-	PRIMARY KEY (id)
-);
+	PRIMARY KEY (id, email_date)
+) PARTITION BY RANGE (email_date);
+
+CREATE TABLE assessments_default PARTITION OF assessments DEFAULT;
 
 
 CREATE TABLE acknowledge (
 	id TEXT NOT NULL, 
+	email_date TIMESTAMP WITH TIME ZONE NOT NULL, 
 	acknowledge BOOLEAN, 
 	created_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(), 
 	edited_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(), 
-	PRIMARY KEY (id)
-);
+	PRIMARY KEY (id, email_date)
+) PARTITION BY RANGE (email_date);
+
+CREATE TABLE acknowledge_default PARTITION OF acknowledge DEFAULT;
 
 
 CREATE TABLE emails (
 	id TEXT NOT NULL, 
+	email_date TIMESTAMP WITH TIME ZONE NOT NULL, 
 	sender TEXT, 
 	recipient TEXT, 
 	subject TEXT, 
@@ -35,8 +45,10 @@ CREATE TABLE emails (
 	link TEXT, 
 	created_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(), 
 	edited_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(), 
-	PRIMARY KEY (id)
-);
+	PRIMARY KEY (id, email_date)
+) PARTITION BY RANGE (email_date);
+
+CREATE TABLE emails_default PARTITION OF emails DEFAULT;
 
 CREATE TABLE email_errors (
 	id TEXT NOT NULL, 
@@ -55,3 +67,23 @@ CREATE TABLE logs (
 	PRIMARY KEY (id)
 );
 
+
+-- Lets app processes invalidate their cached queries when email data changes
+CREATE OR REPLACE FUNCTION notify_email_changes() RETURNS TRIGGER AS $$
+BEGIN
+	PERFORM pg_notify('email_changes', TG_TABLE_NAME);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER emails_notify
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON emails
+FOR EACH STATEMENT EXECUTE FUNCTION notify_email_changes();
+
+CREATE TRIGGER assessments_notify
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON assessments
+FOR EACH STATEMENT EXECUTE FUNCTION notify_email_changes();
+
+CREATE TRIGGER acknowledge_notify
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON acknowledge
+FOR EACH STATEMENT EXECUTE FUNCTION notify_email_changes();
@@ -0,0 +1,22 @@
+-- Adds the NOTIFY triggers from init_v0.sql to an existing v0 database.
+SET search_path TO v0;
+
+-- Lets app processes invalidate their cached queries when email data changes
+CREATE OR REPLACE FUNCTION notify_email_changes() RETURNS TRIGGER AS $$
+BEGIN
+	PERFORM pg_notify('email_changes', TG_TABLE_NAME);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER emails_notify
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON emails
+FOR EACH STATEMENT EXECUTE FUNCTION notify_email_changes();
+
+CREATE TRIGGER assessments_notify
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON assessments
+FOR EACH STATEMENT EXECUTE FUNCTION notify_email_changes();
+
+CREATE TRIGGER acknowledge_notify
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON acknowledge
+FOR EACH STATEMENT EXECUTE FUNCTION notify_email_changes();
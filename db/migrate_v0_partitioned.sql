@@ -0,0 +1,63 @@
+-- Moves an existing v0 database onto the month partitioned email tables from
+-- init_v0.sql. The old tables are kept as *_unpartitioned, copy their rows
+-- with `python app/maintenance.py migrate` afterwards so email_date is
+-- computed by the app's own to_email_date, 1970-01-01 for unparseable dates.
+SET search_path TO v0;
+
+BEGIN;
+
+ALTER TABLE emails RENAME TO emails_unpartitioned;
+ALTER TABLE assessments RENAME TO assessments_unpartitioned;
+ALTER TABLE acknowledge RENAME TO acknowledge_unpartitioned;
+
+ALTER INDEX emails_pkey RENAME TO emails_unpartitioned_pkey;
+ALTER INDEX assessments_pkey RENAME TO assessments_unpartitioned_pkey;
+ALTER INDEX acknowledge_pkey RENAME TO acknowledge_unpartitioned_pkey;
+
+CREATE TABLE assessments (
+	id TEXT NOT NULL,
+	email_date TIMESTAMP WITH TIME ZONE NOT NULL,
+	time_sensitive BOOLEAN,
+	requires_response BOOLEAN,
+	payment_required BOOLEAN,
+	payment_received BOOLEAN,
+	attention_req BOOLEAN,
+	created_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+	edited_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+	PRIMARY KEY (id, email_date)
+) PARTITION BY RANGE (email_date);
+
+CREATE TABLE assessments_default PARTITION OF assessments DEFAULT;
+
+
+CREATE TABLE acknowledge (
+	id TEXT NOT NULL,
+	email_date TIMESTAMP WITH TIME ZONE NOT NULL,
+	acknowledge BOOLEAN,
+	created_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+	edited_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+	PRIMARY KEY (id, email_date)
+) PARTITION BY RANGE (email_date);
+
+CREATE TABLE acknowledge_default PARTITION OF acknowledge DEFAULT;
+
+
+CREATE TABLE emails (
+	id TEXT NOT NULL,
+	email_date TIMESTAMP WITH TIME ZONE NOT NULL,
+	sender TEXT,
+	recipient TEXT,
+	subject TEXT,
+	body TEXT,
+	date TEXT,
+	snippet TEXT,
+	link TEXT,
+	created_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+	edited_date TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+	PRIMARY KEY (id, email_date)
+) PARTITION BY RANGE (email_date);
+
+CREATE TABLE emails_default PARTITION OF emails DEFAULT;
+
+
+COMMIT;